@@ -0,0 +1,44 @@
+"""Microbenchmark for per-page autorenderer generation.
+
+Measures :func:`sphinxcontrib.pseudocode.pseudocode_autorenderer_content` for
+pages with 1, 100 and 1000 pcode blocks, with and without minification.
+Run from the repository root::
+
+    python benchmarks/bench_autorenderer.py
+"""
+
+import sys
+import timeit
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sphinxcontrib.pseudocode import pseudocode_autorenderer_content  # noqa: E402
+
+MACROS = [
+    r'\newcommand{\floor}[1]{\lfloor #1 \rfloor}',
+    r'\newcommand{\ceil}[1]{\lceil #1 \rceil}',
+]
+
+
+def make_dicts(count):
+    return [{'id': str(i + 1), 'linenos': i % 2 == 0, 'captionCount': i}
+            for i in range(count)]
+
+
+def main():
+    for minify in (False, True):
+        app = SimpleNamespace(config=SimpleNamespace(pseudocode_minify_assets=minify))
+        print(f'pseudocode_minify_assets={minify}')
+        for count in (1, 100, 1000):
+            dicts = make_dicts(count)
+            timer = timeit.Timer(
+                lambda: pseudocode_autorenderer_content(app, dicts, MACROS))
+            number, _ = timer.autorange()
+            best = min(timer.repeat(repeat=5, number=number)) / number
+            print(f'  {count:>5} blocks: {best * 1e6:10.1f} us/page')
+
+
+if __name__ == '__main__':
+    main()
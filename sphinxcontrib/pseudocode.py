@@ -9,12 +9,14 @@
     :license: BSD, see LICENSE for details.
 """
 
+import gzip
 import json
 import os
 import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from textwrap import dedent
 
-import jinja2
 import sphinx
 from docutils import nodes
 from docutils.parsers.rst import Directive, directives
@@ -32,13 +34,31 @@ _NEWCOMMAND_RE = re.compile(
 
 filename_autorenderer = 'pseudocode_autorenderer_{}.js'
 
-PROOF_HTML_TITLE_TEMPLATE_VISIT = """ 
-    pseudocode.renderElement(
-    document.getElementById("{{ id }}"), {
-        captionCount: {{ captionCount }},
-        {% if lineNumber %} lineNumber: true {% endif %}
-    });\n
-"""
+# Filled in once per page; all blocks on the page are passed as a single JSON
+# array of ``{"id": ..., "options": ...}`` descriptors.
+AUTORENDERER_TEMPLATE = dedent('''\
+    {sync_macro_init}document.addEventListener("DOMContentLoaded", function() {{
+      var renderAll = function() {{
+        {blocks_json}.forEach(function(block) {{
+          pseudocode.renderElement(document.getElementById(block.id), block.options);
+        }});
+        if (typeof MathJax !== 'undefined' && MathJax.typesetPromise) {{
+          MathJax.typesetPromise();
+        }}
+      }};
+      if (typeof MathJax !== 'undefined' && MathJax.startup) {{
+        MathJax.startup.promise.then(renderAll);
+      }} else {{
+        renderAll();
+      }}
+    }});''')
+
+MACRO_INIT_TEMPLATE = (
+    'window.MathJax = window.MathJax || {{}};\n'
+    'window.MathJax.tex = window.MathJax.tex || {{}};\n'
+    # Existing user macros (from mathjax3_config) take priority over ours.
+    'window.MathJax.tex.macros = Object.assign({macros_json}, window.MathJax.tex.macros || {{}});\n'
+)
 
 
 class pseudocode(nodes.General, nodes.Element):
@@ -135,24 +155,215 @@ def render_mm_html(self, node, code, options, prefix='pseudocode',
 
 
 
+class _AssetWriter(object):
+    """Write generated static assets on a bounded background thread pool.
+
+    Each file is written atomically (temp file + rename) and left untouched
+    when its bytes on disk are already identical.  ``compressors`` is a list
+    of ``(suffix, compress)`` pairs; a compressed sibling is (re)generated
+    when it is missing or not newer than its source file, and siblings for
+    disabled compressors are removed.  Failures are collected and reported
+    as Sphinx warnings by :meth:`drain`.
+    """
+
+    max_workers = 4
+
+    def __init__(self, compressors=()):
+        self._pid = os.getpid()
+        self._compressors = list(compressors)
+        self._executor = ThreadPoolExecutor(
+            max_workers=min(self.max_workers, os.cpu_count() or 1),
+            thread_name_prefix='pseudocode-writer')
+        self._futures = {}
+
+    def submit(self, filepath, data):
+        if os.getpid() != self._pid:
+            # Parallel write workers are forked processes that never see
+            # build-finished, so write inline instead of queueing.
+            try:
+                _write_asset_family(filepath, data, self._compressors)
+            except Exception as exc:
+                _warn_write_failed(filepath, exc)
+            return
+        previous = self._futures.get(filepath)
+        if previous is not None:
+            # Serialise writes to the same path so the last submission wins.
+            try:
+                previous.result()
+            except Exception as exc:
+                _warn_write_failed(filepath, exc)
+        self._futures[filepath] = self._executor.submit(
+            _write_asset_family, filepath, data, self._compressors)
+
+    def drain(self):
+        futures, self._futures = self._futures, {}
+        try:
+            for filepath, future in futures.items():
+                try:
+                    future.result()
+                except Exception as exc:
+                    _warn_write_failed(filepath, exc)
+        finally:
+            self._executor.shutdown(wait=True)
+
+
+def _write_asset(filepath, data):
+    """Atomically write ``data`` to ``filepath`` unless it is already there.
+
+    Return ``True`` if the file was (re)written.
+    """
+    try:
+        with open(filepath, 'rb') as file:
+            if file.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+
+    dirname = os.path.dirname(filepath)
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmppath = tempfile.mkstemp(dir=dirname, prefix='.tmp-pseudocode-')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.chmod(tmppath, 0o644)
+        os.replace(tmppath, filepath)
+    except BaseException:
+        try:
+            os.unlink(tmppath)
+        except OSError:
+            pass
+        raise
+    return True
+
+
+def _write_asset_family(filepath, data, compressors):
+    """Write ``filepath`` and bring its precompressed siblings in line with it."""
+    _write_asset(filepath, data)
+    enabled = {suffix for suffix, compress in compressors}
+    for suffix in COMPRESSED_SUFFIXES:
+        if suffix not in enabled:
+            # A leftover sibling from an earlier build would be served in
+            # place of the current file by precompression-aware servers.
+            try:
+                os.unlink(filepath + suffix)
+            except FileNotFoundError:
+                pass
+    source_mtime = os.stat(filepath).st_mtime_ns
+    for suffix, compress in compressors:
+        sibling = filepath + suffix
+        try:
+            # Judge staleness from the sibling itself so an interrupted build
+            # cannot leave it permanently out of date.  Equal mtimes count as
+            # stale for filesystems with coarse timestamps; the byte comparison
+            # in _write_asset then avoids a needless rewrite.
+            if os.stat(sibling).st_mtime_ns > source_mtime:
+                continue
+        except FileNotFoundError:
+            pass
+        _write_asset(sibling, compress(data))
+
+
+COMPRESSED_SUFFIXES = ('.gz', '.br')
+
+
+def _gzip_compress(data):
+    # mtime=0 keeps the output reproducible so unchanged files stay unchanged.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def asset_compressors(app):
+    """Return the ``(suffix, compress)`` pairs enabled for this build."""
+    if not app.config.pseudocode_precompress_assets:
+        return []
+    compressors = [('.gz', _gzip_compress)]
+    try:
+        import brotli
+    except ImportError:
+        logger.warning('pseudocode: brotli is not installed; only .gz siblings '
+                       'will be written for pcode assets '
+                       '(pip install sphinxcontrib-pseudocode[precompress])')
+    else:
+        compressors.append(('.br', brotli.compress))
+    return compressors
+
+
+def _is_js_ident(ch):
+    return ch.isalnum() or ch in '_$'
+
+
+def minify_js(source):
+    """Strip insignificant whitespace from generated JavaScript.
+
+    Only meant for the code this module emits: string literals are preserved,
+    but comments and regular expression literals are not understood.
+    """
+    out = []
+    quote = None
+    escaped = False
+    pending_space = False
+    for ch in source:
+        if quote:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == quote:
+                quote = None
+            continue
+        if ch.isspace():
+            pending_space = True
+            continue
+        if pending_space and out and _is_js_ident(out[-1]) and _is_js_ident(ch):
+            out.append(' ')
+        pending_space = False
+        if ch in '\'"`':
+            quote = ch
+        out.append(ch)
+    return ''.join(out)
+
+
+# Per-page values are filled in as compact JSON, so minifying the fixed parts
+# once here is enough to minify every generated file.
+_MINIFIED_AUTORENDERER_TEMPLATE = minify_js(AUTORENDERER_TEMPLATE)
+_MINIFIED_MACRO_INIT_TEMPLATE = minify_js(MACRO_INIT_TEMPLATE)
+
+
+def _warn_write_failed(filepath, exc):
+    logger.warning('pseudocode: failed to write %s: %s', filepath, exc)
+
+
+def get_asset_writer(app):
+    """Return the background asset writer for the current build."""
+    writer = getattr(app, '_pseudocode_asset_writer', None)
+    if writer is None:
+        writer = app._pseudocode_asset_writer = _AssetWriter(asset_compressors(app))
+    return writer
+
+
 def write_pseudocode_autorenderer_file(app, filename, dicts, all_macros=None):
-    outdir = os.path.join(app.builder.outdir, '_static')
-    os.makedirs(outdir, exist_ok=True)
-    filepath = os.path.join(outdir, filename)
+    filepath = os.path.join(app.builder.outdir, '_static', filename)
     content = pseudocode_autorenderer_content(app, dicts, all_macros)
-    with open(filepath, 'w') as file:
-        file.write(content)
+    get_asset_writer(app).submit(filepath, content.encode('utf-8'))
 
 
 def pseudocode_autorenderer_content(app, dicts, all_macros=None):
-    functions = ''
+    if app.config.pseudocode_minify_assets:
+        separators = (',', ':')
+        template = _MINIFIED_AUTORENDERER_TEMPLATE
+        macro_init_template = _MINIFIED_MACRO_INIT_TEMPLATE
+    else:
+        separators = None
+        template = AUTORENDERER_TEMPLATE
+        macro_init_template = MACRO_INIT_TEMPLATE
+
+    blocks = []
     for pairs in dicts:
         if (pairs['id'] != ''):
-            functions += jinja2.Template(PROOF_HTML_TITLE_TEMPLATE_VISIT).render(
-                id=pairs['id'],
-                lineNumber=pairs['linenos'],
-                captionCount=pairs.get('captionCount', 0)
-            )
+            options = {'captionCount': pairs.get('captionCount', 0)}
+            if pairs['linenos']:
+                options['lineNumber'] = True
+            blocks.append({'id': pairs['id'], 'options': options})
 
     # Convert \newcommand strings to MathJax tex.macros format so macros are
     # configured before MathJax initialises (the autorenderer is synchronous;
@@ -167,39 +378,25 @@ def pseudocode_autorenderer_content(app, dicts, all_macros=None):
 
     sync_macro_init = ''
     if mathjax_macros:
-        macros_json = json.dumps(mathjax_macros)
-        sync_macro_init = (
-            'window.MathJax = window.MathJax || {};\n'
-            'window.MathJax.tex = window.MathJax.tex || {};\n'
-            # Existing user macros (from mathjax3_config) take priority over ours.
-            f'window.MathJax.tex.macros = Object.assign({macros_json}, window.MathJax.tex.macros || {{}});\n'
-        )
+        sync_macro_init = macro_init_template.format(
+            macros_json=json.dumps(mathjax_macros, separators=separators))
 
-    content = dedent('''\
-            {sync_macro_init}document.addEventListener("DOMContentLoaded", function() {{
-              var renderAll = function() {{
-                {functions}
-                if (typeof MathJax !== 'undefined' && MathJax.typesetPromise) {{
-                  MathJax.typesetPromise();
-                }}
-              }};
-              if (typeof MathJax !== 'undefined' && MathJax.startup) {{
-                MathJax.startup.promise.then(renderAll);
-              }} else {{
-                renderAll();
-              }}
-            }});''')
-
-    content = content.format(functions=functions, sync_macro_init=sync_macro_init)
-    return content
+    return template.format(
+        blocks_json=json.dumps(blocks, separators=separators),
+        sync_macro_init=sync_macro_init)
 
 
 def builder_inited(app):
     install_js(app)
+    # Create the writer up front so forked parallel write workers inherit it.
+    get_asset_writer(app)
 
 
 def builder_finished(app, exception):
-    pass
+    writer = getattr(app, '_pseudocode_asset_writer', None)
+    if writer is not None:
+        app._pseudocode_asset_writer = None
+        writer.drain()
 
 def install_js(app, *args):
     app.add_js_file("https://cdn.jsdelivr.net/npm/pseudocode@latest/build/pseudocode.js")
@@ -358,6 +555,8 @@ def setup(app):
 
     app.add_directive('pcode', Pseudocode)
     app.config.numfig_format.setdefault('pseudocode', 'Algorithm %s')
+    app.add_config_value('pseudocode_minify_assets', False, 'html')
+    app.add_config_value('pseudocode_precompress_assets', False, 'html')
     app.connect('builder-inited', builder_inited)
     app.connect('doctree-resolved', doctree_resolved)
     app.connect('html-page-context', install_js2_part2)
@@ -19,6 +19,7 @@ prevent rendering; a green run does not guarantee rendering is pixel-perfect.
 """
 
 import io
+import os
 import re
 from pathlib import Path
 
@@ -34,7 +35,9 @@ DOCS_DIR = Path(__file__).parent.parent / 'docs'
 
 @pytest.fixture
 def build_all(app):
-    app.builder.build_all()
+    # Go through Sphinx.build() so build-finished fires and the background
+    # asset writer is drained before the test inspects the output.
+    app.build(force_all=True)
 
 
 @pytest.fixture
@@ -69,6 +72,103 @@ def test_autorenderer_js_written_to_static(app, build_all):
     assert 'DOMContentLoaded' in js_file.read_text()
 
 
+@pytest.mark.sphinx('html', testroot="basic")
+def test_autorenderer_js_not_rewritten_when_unchanged(app, build_all):
+    """Identical autorenderer bytes must leave the file on disk untouched."""
+    js_file = app.outdir / '_static' / 'pseudocode_autorenderer_index.js'
+    before = js_file.stat()
+    app.build(force_all=True)
+    after = js_file.stat()
+    assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+
+
+@pytest.mark.sphinx('html', testroot="basic")
+def test_asset_write_failure_reported_as_warning(app, warning, tmp_path):
+    """Errors from the background writer surface as Sphinx warnings on drain."""
+    from sphinxcontrib.pseudocode import _AssetWriter
+
+    blocker = tmp_path / 'not-a-dir'
+    blocker.write_text('')
+    writer = _AssetWriter()
+    writer.submit(str(blocker / 'pseudocode_autorenderer_x.js'), b'x')
+    writer.drain()
+    assert 'pseudocode: failed to write' in warning.getvalue()
+
+
+@pytest.mark.sphinx('html', testroot="basic")
+def test_asset_compressor_failure_reported_as_warning(app, warning, tmp_path):
+    """Non-OSError failures from a worker are reported, not raised."""
+    from sphinxcontrib.pseudocode import _AssetWriter
+
+    def broken(data):
+        raise ValueError('compressor exploded')
+
+    writer = _AssetWriter([('.gz', broken)])
+    writer.submit(str(tmp_path / 'a.js'), b'a')
+    writer.submit(str(tmp_path / 'b.js'), b'b')
+    writer.drain()
+    assert warning.getvalue().count('compressor exploded') == 2
+    assert (tmp_path / 'b.js').read_bytes() == b'b'
+
+
+@pytest.mark.sphinx('html', testroot="basic")
+def test_asset_write_failure_during_build_reported_as_warning(app, warning, monkeypatch):
+    """A failed autorenderer write is reported when build-finished drains."""
+    import sphinxcontrib.pseudocode as pseudocode_ext
+
+    def unwritable(filepath, data):
+        raise PermissionError(13, 'Permission denied', filepath)
+
+    # Fail inside the worker rather than via file permissions, which do not
+    # apply when the suite runs as root.
+    monkeypatch.setattr(pseudocode_ext, '_write_asset', unwritable)
+    app.build(force_all=True)
+    js_target = app.outdir / '_static' / 'pseudocode_autorenderer_index.js'
+    assert 'pseudocode: failed to write' in warning.getvalue()
+    assert str(js_target) in warning.getvalue()
+    assert (app.outdir / 'index.html').exists()
+
+
+@pytest.mark.sphinx('html', testroot="newcommand",
+                    confoverrides={'pseudocode_minify_assets': True,
+                                   'pseudocode_precompress_assets': True})
+def test_autorenderer_js_minified_and_precompressed(app, build_all):
+    """Minified autorenderer JS gets .gz (and, with brotli, .br) siblings."""
+    import gzip
+
+    js_file = app.outdir / '_static' / 'pseudocode_autorenderer_index.js'
+    js = js_file.read_bytes()
+    assert b'\n' not in js
+    assert b'"floor":' in js
+    assert b'typeof MathJax!==\'undefined\'' in js
+    assert gzip.decompress((app.outdir / '_static' / (js_file.name + '.gz')).read_bytes()) == js
+
+    brotli = pytest.importorskip('brotli')
+    assert brotli.decompress((app.outdir / '_static' / (js_file.name + '.br')).read_bytes()) == js
+
+
+def test_precompressed_siblings_follow_source(tmp_path):
+    """Stale siblings are refreshed when enabled and removed when disabled."""
+    import gzip
+
+    from sphinxcontrib.pseudocode import _gzip_compress, _write_asset_family
+
+    js_file = tmp_path / 'pseudocode_autorenderer_index.js'
+    gz_file = tmp_path / (js_file.name + '.gz')
+    _write_asset_family(str(js_file), b'old', [('.gz', _gzip_compress)])
+
+    # Simulate a build that replaced the source but died before its siblings.
+    js_file.write_bytes(b'new')
+    os.utime(gz_file, ns=(0, 0))
+    _write_asset_family(str(js_file), b'new', [('.gz', _gzip_compress)])
+    assert gzip.decompress(gz_file.read_bytes()) == b'new'
+
+    (tmp_path / (js_file.name + '.br')).write_bytes(b'stale')
+    _write_asset_family(str(js_file), b'newer', [])
+    assert js_file.read_bytes() == b'newer'
+    assert list(tmp_path.iterdir()) == [js_file]
+
+
 # ---------------------------------------------------------------------------
 # \\newcommand / macro tests (test-newcommand testroot)
 # ---------------------------------------------------------------------------
@@ -157,10 +257,10 @@ def docs_autorenderer_js(built_docs):
 
 
 def test_docs_all_numbered_blocks_wired_to_autorenderer(docs_index_html, docs_autorenderer_js):
-    """Every numbered pcode block must have a matching renderElement call.
+    """Every numbered pcode block must have a matching renderElement descriptor.
 
     Structural check only: verifies every <pre id="N"> in the HTML has a
-    corresponding renderElement("N") call in the autorenderer JS.  This catches
+    corresponding {"id": "N"} descriptor in the autorenderer JS.  This catches
     blocks that were silently dropped from the autorenderer (left permanently
     hidden as raw <pre> elements regardless of JS engine).
 
@@ -169,9 +269,11 @@ def test_docs_all_numbered_blocks_wired_to_autorenderer(docs_index_html, docs_au
     """
     pre_ids = {m for m in re.findall(r'<pre id="([^"]*)"', docs_index_html) if m}
     assert pre_ids, "No numbered pcode blocks found in docs output"
+    assert 'pseudocode.renderElement(document.getElementById(block.id)' in docs_autorenderer_js
+    block_ids = set(re.findall(r'"id":\s*"([^"]*)"', docs_autorenderer_js))
     for pre_id in sorted(pre_ids):
-        assert f'getElementById("{pre_id}")' in docs_autorenderer_js, (
-            f'pcode block id="{pre_id}" has no renderElement call in the autorenderer'
+        assert pre_id in block_ids, (
+            f'pcode block id="{pre_id}" has no renderElement descriptor in the autorenderer'
         )
 
 